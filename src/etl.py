@@ -3,11 +3,28 @@ import sys
 import time
 import logging
 import re
-from typing import Dict, List, Tuple, Optional, Any
-
+import uuid
+import shutil
+import hashlib
+import xml.etree.ElementTree as ET
+from email.parser import BytesParser
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import quote, urlencode
+from collections import deque
+from functools import lru_cache
+from itertools import groupby, islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Optional, Any
+
+import ijson
+import orjson
 import requests
-import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
 
 try:
     from dotenv import load_dotenv
@@ -35,10 +52,50 @@ OUTPUT_CSV      = env_or_default("OUTPUT_CSV", "data/employee_data.csv")
 SAP_USERNAME    = os.getenv("SAP_USERNAME")
 SAP_PASSWORD    = os.getenv("SAP_PASSWORD")
 
-REQUEST_PAUSE = float(env_or_default("REQUEST_PAUSE", "0.2"))
+# 429/5xx are retried by the session adapter below; otherwise we only pause when the
+# server says so (Retry-After, or X-RateLimit-Remaining at/below this floor)
+RATE_LIMIT_FLOOR = int(env_or_default("RATE_LIMIT_FLOOR", "1"))
+MAX_WORKERS   = int(env_or_default("MAX_WORKERS", "16"))
+# Structures per $filter; keeps the request URL comfortably under ~2KB
+FILTER_CHUNK_SIZE = int(env_or_default("FILTER_CHUNK_SIZE", "25"))
+# Send chunk queries through the OData $batch endpoint, BATCH_QUERIES GETs per POST
+USE_BATCH     = env_or_default("SAP_USE_BATCH", "0").lower() in ("1", "true", "yes")
+BATCH_QUERIES = int(env_or_default("BATCH_QUERIES", "2"))
+# Rows per $top/$skip page. A page shorter than $top is read as the end of the data, so
+# the page size must not exceed the server's own $top cap (above it ByD silently truncates).
+# SAP_MAX_PAGE_SIZE is that cap; raise it only for a service known to allow bigger pages.
+MAX_PAGE_SIZE = int(env_or_default("SAP_MAX_PAGE_SIZE", "1000"))
+PAGE_SIZE     = int(env_or_default("SAP_PAGE_SIZE", "1000"))
+if PAGE_SIZE > MAX_PAGE_SIZE:
+    logging.warning("SAP_PAGE_SIZE=%d exceeds the server page cap; using %d", PAGE_SIZE, MAX_PAGE_SIZE)
+    PAGE_SIZE = MAX_PAGE_SIZE
+# If set, completed pages are recorded here so a failed run resumes where it stopped.
+# A run with failed chunks then aborts rather than publishing a partial CSV, and the
+# directory is only cleared after a run where every chunk succeeded
+CHECKPOINT_DIR = env_or_default("SAP_CHECKPOINT_DIR", "")
+# Checkpoints not touched for this long are from an abandoned run and are discarded,
+# so a resume never stitches in rows from a stale snapshot of the data
+CHECKPOINT_MAX_AGE_HOURS = float(env_or_default("SAP_CHECKPOINT_MAX_AGE_HOURS", "24"))
 
 SESSION = requests.Session()
+# Every query also sends $format=json, which takes precedence over Accept, so the wire
+# format stays verbose v2 JSON; the per-row __metadata is dropped while parsing instead
 SESSION.headers.update({"Accept": "application/json"})
+# Keep-alive pool big enough for the worker threads; back off on throttling and 5xx
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=max(64, MAX_WORKERS),
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "POST"],
+        raise_on_status=False,
+    ),
+))
+# Credentials ride on the session, so every request (and the pooled connection) reuses them
+if SAP_USERNAME and SAP_PASSWORD:
+    SESSION.auth = HTTPBasicAuth(SAP_USERNAME, SAP_PASSWORD)
 
 # Landon’s “main” fields (keep your core deliverables)
 BASE_SELECT_FIELDS = [
@@ -60,48 +117,211 @@ RENAME_MAP = {
     "C0CHAR_STRUCTURE": "Structure",
 }
 
+# Characteristics that identify a row (with the structure field); ordering by them keeps
+# $skip page boundaries stable, so no row is duplicated or skipped between pages
+ROW_KEY_FIELDS = ["CEMPLOYEE_UUID", "C0DATEFROM", "C0DATETO"]
+
+# Arrow types for the selected fields; anything not listed here is a string column
+FIELD_TYPES = {
+    "KCLEAVERS": pa.float64(),
+}
+
 # Candidate structure field names (ByD can use either)
 STRUCT_CANDIDATES = ["COCHAR_STRUCTURE", "C0CHAR_STRUCTURE"]
 
 # ---------------------- URL helpers ----------------------
-def _auth() -> Optional[HTTPBasicAuth]:
-    if SAP_USERNAME and SAP_PASSWORD:
-        return HTTPBasicAuth(SAP_USERNAME, SAP_PASSWORD)
-    return None
-
+# Config is fixed at import, so the URLs only need building once
+@lru_cache(maxsize=None)
 def _root_url() -> str:
     return f"{SAP_BASE_URL.rstrip('/')}/{SAP_ODATA_PATH.strip('/')}".rstrip("/")
 
+@lru_cache(maxsize=None)
 def _entity_url(entity: str) -> str:
     return f"{_root_url()}/{entity.strip('/')}".rstrip("/")
 
-def _get_raw(url: str, params: Dict[str, str]) -> requests.Response:
-    return SESSION.get(url, params=params, auth=_auth(), timeout=90)
-
-def _get_json_or_raise(url: str, params: Dict[str, str]) -> Dict:
-    resp = _get_raw(url, params)
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    # Retry-After is either delta-seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def _throttle(resp: requests.Response) -> None:
+    """
+    Sleep only when the response asks us to slow down.
+    """
+    delay = _retry_after_seconds(resp.headers.get("Retry-After"))
+    remaining = resp.headers.get("X-RateLimit-Remaining", "")
+    if delay is None and remaining.isdigit() and int(remaining) <= RATE_LIMIT_FLOOR:
+        delay = 1.0
+    if delay:
+        logging.info("Rate limited by server; sleeping %.1fs", delay)
+        time.sleep(delay)
+
+def _get_raw(url: str, params: Dict[str, str], stream: bool = False,
+             headers: Optional[Dict[str, str]] = None) -> requests.Response:
+    resp = SESSION.get(url, params=params, timeout=90, stream=stream, headers=headers)
+    # Error responses have already been through the retry backoff, which honours Retry-After
+    if resp.ok:
+        _throttle(resp)
+    return resp
+
+def _batch_part_path(url: str, params: Dict[str, str]) -> str:
+    # $batch parts address resources relative to the service root
+    path = url[len(_root_url()):].lstrip("/") if url.startswith(_root_url()) else url
+    if params:
+        path += ("&" if "?" in path else "?") + urlencode(params, quote_via=quote)
+    return path
+
+def post_batch(requests_list: List[Tuple[str, Dict[str, str]]]) -> List[Dict]:
+    """
+    Send several GETs as one multipart/mixed POST to the service's $batch endpoint.
+    Returns the decoded JSON body of each part, in request order.
+    """
+    boundary = f"batch_{uuid.uuid4().hex}"
+    parts = []
+    for url, params in requests_list:
+        parts.append(
+            f"--{boundary}\r\n"
+            "Content-Type: application/http\r\n"
+            "Content-Transfer-Encoding: binary\r\n\r\n"
+            f"GET {_batch_part_path(url, params)} HTTP/1.1\r\n"
+            f"Accept: {SESSION.headers['Accept']}\r\n\r\n"
+        )
+    body = "".join(parts) + f"--{boundary}--\r\n"
+
+    batch_url = f"{_root_url()}/$batch"
+    resp = SESSION.post(batch_url, data=body.encode("utf-8"), timeout=90,
+                        headers={"Content-Type": f"multipart/mixed; boundary={boundary}"})
     if not resp.ok:
-        logging.error("HTTP %s for %s params=%s\nBody: %s",
-                      resp.status_code, url, params, resp.text[:2000])
+        logging.error("HTTP %s for %s\nBody: %s", resp.status_code, batch_url, resp.text[:2000])
         resp.raise_for_status()
-    return resp.json()
+    _throttle(resp)
+
+    content_type = resp.headers.get("Content-Type", "").encode("latin-1")
+    msg = BytesParser().parsebytes(b"Content-Type: " + content_type + b"\r\n\r\n" + resp.content)
+    results = []
+    for part in msg.get_payload():
+        # Each part wraps a full HTTP response: status line, headers, blank line, body
+        head, _, part_body = part.get_payload(decode=True).replace(b"\r\n", b"\n").partition(b"\n\n")
+        status = int(head.split(b" ", 2)[1])
+        if status >= 400:
+            logging.error("HTTP %s in $batch part\nBody: %s", status, part_body[:2000])
+            raise requests.HTTPError(f"{status} error in $batch part for {batch_url}", response=resp)
+        results.append(orjson.loads(part_body))
+    if len(results) != len(requests_list):
+        # Callers pair results with their queries positionally, so a short reply would drop queries
+        raise requests.HTTPError(f"$batch returned {len(results)} parts for {len(requests_list)} requests "
+                                 f"at {batch_url}", response=resp)
+    return results
 
 def _extract_results_and_next(data: Dict) -> Tuple[List[Dict], Optional[str]]:
     if "d" in data:
         d = data["d"]
-        return d.get("results", []), d.get("__next")
-    return data.get("value", []), data.get("@odata.nextLink") or data.get("odata.nextLink")
+        results, next_link = d.get("results", []), d.get("__next")
+    else:
+        results = data.get("value", [])
+        next_link = data.get("@odata.nextLink") or data.get("odata.nextLink")
+    # v2 verbose JSON nests __metadata, __deferred navigation links and expanded
+    # results in rows; we only $select scalars, so keep just those
+    results = [{k: v for k, v in r.items() if not isinstance(v, (dict, list))} for r in results]
+    return results, next_link
+
+# Where rows and the next-page link live in v2 ("d") and v4 ("value") JSON
+_ROW_PREFIXES = ("d.results.item", "value.item")
+_NEXT_PREFIXES = ("d.__next", "@odata.nextLink", "odata.nextLink")
+_SCALAR_EVENTS = frozenset(("null", "boolean", "integer", "double", "number", "string"))
+
+def _stream_rows_and_next(url: str, params: Dict[str, str]) -> Tuple[List[Dict], Optional[str]]:
+    """
+    GET a page and return its rows and next link like _extract_results_and_next, but parse the body
+    incrementally with ijson so only the rows (not the whole document tree) are built.
+    Nested values in a row (__metadata and friends) are skipped, never materialized.
+    """
+    with _get_raw(url, params, stream=True) as resp:
+        if not resp.ok:
+            logging.error("HTTP %s for %s params=%s\nBody: %s",
+                          resp.status_code, url, params, resp.text[:2000])
+            resp.raise_for_status()
+        return _read_rows_and_next(resp)
+
+def _read_rows_and_next(resp: requests.Response) -> Tuple[List[Dict], Optional[str]]:
+    # Incremental parse of an OK streamed response (see _stream_rows_and_next)
+    resp.raw.decode_content = True  # let urllib3 undo gzip/deflate
+    rows: List[Dict] = []
+    next_link = None
+    row = None
+    row_prefix = value_prefix = key = ""
+    for prefix, event, value in ijson.parse(resp.raw, use_float=True):
+        if row is not None:
+            if prefix == row_prefix:
+                if event == "map_key":
+                    key, value_prefix = value, f"{row_prefix}.{value}"
+                elif event == "end_map":
+                    rows.append(row)
+                    row = None
+            # only direct scalar members; anything deeper has a longer prefix
+            elif prefix == value_prefix and event in _SCALAR_EVENTS:
+                row[key] = value
+        elif event == "start_map" and prefix in _ROW_PREFIXES:
+            row, row_prefix, value_prefix = {}, prefix, ""
+        elif event == "string" and prefix in _NEXT_PREFIXES:
+            next_link = value
+    return rows, next_link
+
+_MISSING_SEGMENT_RE = re.compile(r"segment\s+'([^']+)'")
 
 def _extract_missing_segment(resp_text: str) -> Optional[str]:
-    m = re.search(r"segment\s+'([^']+)'", resp_text)
+    m = _MISSING_SEGMENT_RE.search(resp_text)
     return m.group(1) if m else None
 
 # ---------------------- Detect correct structure field ----------------------
+def _entity_properties(entity: str) -> Optional[Set[str]]:
+    """
+    Property names of the entity set's type, read from the service $metadata document.
+    None if the document can't be fetched or doesn't describe the entity set.
+    """
+    url = f"{_root_url()}/$metadata"
+    resp = _get_raw(url, {}, headers={"Accept": "application/xml"})
+    if not resp.ok:
+        logging.warning("HTTP %s for %s; cannot read the schema", resp.status_code, url)
+        return None
+    try:
+        root = ET.fromstring(resp.content)
+    except ET.ParseError as e:
+        logging.warning("Unparseable $metadata: %s", e)
+        return None
+
+    # Tags are namespaced differently per EDM version, so match on the local name
+    elements = [(el.tag.rsplit("}", 1)[-1], el) for el in root.iter()]
+    type_name = next((el.get("EntityType", "") for tag, el in elements
+                      if tag == "EntitySet" and el.get("Name") == entity), "")
+    type_name = type_name.rsplit(".", 1)[-1]
+    for tag, el in elements:
+        if tag == "EntityType" and el.get("Name") == type_name:
+            return {p.get("Name") for p in el if p.tag.rsplit("}", 1)[-1] == "Property"}
+    return None
+
+@lru_cache(maxsize=None)
 def detect_structure_field(entity: str) -> str:
     """
-    Try candidates via $select; return the one the service accepts.
-    We use a tiny $top=1 request so it’s fast.
+    Look the candidates up in the service $metadata (one request).
+    If that doesn't work out, try each candidate via a tiny $select/$top=1 probe.
     """
+    props = _entity_properties(entity)
+    if props is not None:
+        for field in STRUCT_CANDIDATES:
+            if field in props:
+                logging.info("Detected structure field from $metadata: %s", field)
+                return field
+        logging.warning("None of %s in $metadata for %s; probing instead", STRUCT_CANDIDATES, entity)
+
     url = _entity_url(entity)
     for field in STRUCT_CANDIDATES:
         params = {"$select": field, "$top": "1", "$format": "json"}
@@ -120,94 +340,328 @@ def detect_structure_field(entity: str) -> str:
 
     raise RuntimeError("Could not detect a valid structure field (tried COCHAR_STRUCTURE and C0CHAR_STRUCTURE).")
 
+# ---------------------- Checkpoints ----------------------
+def _checkpoint_path(params: Dict[str, str]) -> str:
+    key = hashlib.sha1(orjson.dumps(params, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    return os.path.join(CHECKPOINT_DIR, f"{key}.jsonl")
+
+def _discard_stale_checkpoints() -> None:
+    if not CHECKPOINT_DIR or not os.path.isdir(CHECKPOINT_DIR):
+        return
+    cutoff = time.time() - CHECKPOINT_MAX_AGE_HOURS * 3600
+    stale = [e.path for e in os.scandir(CHECKPOINT_DIR)
+             if e.name.endswith(".jsonl") and e.stat().st_mtime < cutoff]
+    for path in stale:
+        os.remove(path)
+    if stale:
+        logging.info("Discarded %d checkpoints older than %gh", len(stale), CHECKPOINT_MAX_AGE_HOURS)
+
+def _load_checkpoint(params: Dict[str, str]) -> Tuple[List[Tuple], Optional[int]]:
+    """
+    Rows already fetched for this query and the $skip to continue from
+    (None when the query was fully fetched).
+    """
+    if not CHECKPOINT_DIR or not os.path.exists(_checkpoint_path(params)):
+        return [], 0
+    rows: List[Tuple] = []
+    skip: Optional[int] = 0
+    with open(_checkpoint_path(params), "rb") as f:
+        for line in f:
+            page = orjson.loads(line)
+            rows.extend(map(tuple, page["rows"]))
+            skip = page["skip"]
+    logging.info("  resuming from checkpoint: %d rows, next $skip=%s", len(rows), skip)
+    return rows, skip
+
+def _save_page(params: Dict[str, str], page: List[Tuple], skip: int, top_per_page: int) -> Optional[int]:
+    """
+    Record a completed page and return the next $skip (None once a short page ends the query).
+    """
+    next_skip = skip + top_per_page if len(page) >= top_per_page else None
+    if CHECKPOINT_DIR:
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        with open(_checkpoint_path(params), "ab") as f:
+            f.write(orjson.dumps({"rows": page, "skip": next_skip}) + b"\n")
+    return next_skip
+
 # ---------------------- Core ETL ----------------------
+def _fetch_all_pages(url: str, params: Dict[str, str], top_per_page: int,
+                     first_page: Optional[Tuple[List[Dict], Optional[str]]] = None) -> List[Dict]:
+    """
+    All rows of a query, paged with $top/$skip until a short page, following any
+    server-side __next links within each page. first_page is the already-read $skip=0 page.
+    """
+    rows: List[Dict] = []
+    skip = 0
+    while True:
+        if first_page is not None:
+            page, next_link = first_page
+            first_page = None
+        else:
+            page, next_link = _stream_rows_and_next(url, {**params, "$top": str(top_per_page), "$skip": str(skip)})
+        while next_link:
+            more, next_link = _stream_rows_and_next(next_link, {})
+            page.extend(more)
+        rows.extend(page)
+        if len(page) < top_per_page:
+            return rows
+        skip += top_per_page
+
 def fetch_distinct_structures() -> Tuple[str, List[str]]:
     """
     Fetch distinct structures. IMPORTANT: your error proves COCHAR_STRUCTURE is not valid here,
     so we detect and use whichever exists (usually C0CHAR_STRUCTURE).
+    Asks the server for the DISTINCT via $apply=groupby; pure v2 services reject that,
+    in which case we page through the ordered column and collapse adjacent repeats.
     """
     struct_field = detect_structure_field(SAP_CODES_QUERY)
     url = _entity_url(SAP_CODES_QUERY)
-    params = {"$select": struct_field, "$top": "1000000", "$format": "json"}
-    data = _get_json_or_raise(url, params)
-    results, _ = _extract_results_and_next(data)
 
-    vals = [r.get(struct_field) for r in results if r.get(struct_field)]
-    distinct = sorted(set(vals))
-    logging.info("Fetched %d distinct %s values", len(distinct), struct_field)
+    # Page both queries like the row queries: a single huge $top would be silently cut at
+    # the server's page cap and lose structures without any error
+    params = {"$apply": f"groupby(({struct_field}))", "$select": struct_field,
+              "$orderby": struct_field, "$format": "json"}
+    first_params = {**params, "$top": str(PAGE_SIZE), "$skip": "0"}
+    with _get_raw(url, first_params, stream=True) as resp:
+        if resp.ok:
+            first_page = _read_rows_and_next(resp)
+        elif resp.status_code not in (400, 404, 501):
+            logging.error("HTTP %s for %s params=%s\nBody: %s", resp.status_code, url, first_params, resp.text[:2000])
+            resp.raise_for_status()
+    if resp.ok:
+        results = _fetch_all_pages(url, params, PAGE_SIZE, first_page)
+        values = {r.get(struct_field) for r in results}
+        distinct = sorted(v for v in values if v)
+        if len(results) > len(values):
+            # A v2 service may silently ignore unknown $ options and send every row
+            logging.info("Service ignored $apply (%d rows for %d distinct %s values); deduplicated client-side",
+                         len(results), len(distinct), struct_field)
+        else:
+            logging.info("Fetched %d distinct %s values; server returned them grouped",
+                         len(distinct), struct_field)
+        return struct_field, distinct
+
+    logging.info("Service rejected $apply (HTTP %s); falling back to ordered $select", resp.status_code)
+    params = {"$select": struct_field, "$orderby": struct_field, "$format": "json"}
+    results = _fetch_all_pages(url, params, PAGE_SIZE)
+
+    # Rows arrive sorted, so duplicates are adjacent
+    distinct = [v for v, _ in groupby(r.get(struct_field) for r in results) if v]
+    logging.info("Fetched %d distinct %s values via ordered $select", len(distinct), struct_field)
     return struct_field, distinct
 
-def fetch_rows_for_structure(struct_field: str, structure_value: str, top_per_page: int = 1000000) -> List[Dict]:
-    """
-    Pull rows filtered by the detected structure field.
-    """
-    base_url = _entity_url(SAP_MAIN_QUERY)
+def _chunks(values: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(values)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
 
-    # Use the same detected structure field for filtering the same entity
-    filter_value = structure_value.replace("'", "''")
+def _structure_filter(struct_field: str, structure_values: List[str]) -> str:
+    # OData v2 (ByD) has no `in` operator, so OR the equality predicates together
+    quoted = (v.replace("'", "''") for v in structure_values)
+    return " or ".join(f"{struct_field} eq '{v}'" for v in quoted)
 
+def _select_fields(struct_field: str) -> List[str]:
     # Make sure the select includes the structure field too
     working_fields = list(BASE_SELECT_FIELDS)
     if struct_field not in working_fields:
         working_fields.append(struct_field)
+    return working_fields
 
-    select = ",".join(working_fields)
+def _structure_query(struct_field: str, structure_values: List[str], top_per_page: int) -> Tuple[str, Dict[str, str]]:
+    base_url = _entity_url(SAP_MAIN_QUERY)
     params = {
-        "$select": select,
+        "$select": ",".join(_select_fields(struct_field)),
         "$top": str(top_per_page),
+        "$orderby": ",".join([struct_field] + ROW_KEY_FIELDS),
         "$format": "json",
-        "$filter": f"{struct_field} eq '{filter_value}'",
+        "$filter": _structure_filter(struct_field, structure_values),
     }
+    return base_url, params
+
+def _arrow_schema(fields: List[str]) -> pa.Schema:
+    return pa.schema([(f, FIELD_TYPES.get(f, pa.string())) for f in fields])
+
+def _row_tuples(rows: List[Dict], fields: List[str]) -> List[Tuple]:
+    # We chose the columns via $select, so a fixed-order tuple carries the same data
+    # as the row dict at a fraction of the size
+    return [tuple(r.get(f) for f in fields) for r in rows]
+
+def _to_float(v: Any) -> Optional[float]:
+    # v2 sends decimals as strings; blank or unparseable values become null
+    if v is None or v == "":
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+def _arrow_column(field: str, values: List[Any], type_: pa.DataType) -> pa.Array:
+    if pa.types.is_floating(type_):
+        parsed = [_to_float(v) for v in values]
+        bad = sum(1 for v, p in zip(values, parsed) if p is None and v not in (None, ""))
+        if bad:
+            logging.warning("  %d non-numeric %s values written as empty", bad, field)
+        return pa.array(parsed, type=type_)
+    if pa.types.is_string(type_):
+        # Whatever the wire type (numbers, booleans, mixed), write it through as text
+        return pa.array([v if v is None or isinstance(v, str) else str(v) for v in values], type=type_)
+    return pa.array(values, type=type_)
+
+def _rows_to_table(rows: List[Tuple], fields: List[str]) -> pa.Table:
+    """
+    Columnar copy of a chunk's rows in the target schema. Values are normalized per
+    column instead of cast, so an odd wire value can't abort the run.
+    """
+    schema = _arrow_schema(fields)
+    columns = [list(values) for values in zip(*rows)]
+    return pa.Table.from_arrays(
+        [_arrow_column(f.name, values, f.type) for f, values in zip(schema, columns)], schema=schema)
 
-    resp = _get_raw(base_url, params)
-    if not resp.ok:
-        logging.error("HTTP %s for %s params=%s\nBody: %s", resp.status_code, base_url, params, resp.text[:2000])
-        resp.raise_for_status()
-
-    data = resp.json()
-    rows, next_link = _extract_results_and_next(data)
-    all_rows = list(rows)
-
-    while next_link:
-        time.sleep(REQUEST_PAUSE)
-        data2 = _get_json_or_raise(next_link, {})
-        rows2, next_link = _extract_results_and_next(data2)
-        all_rows.extend(rows2)
-
-    logging.info("  %s=%s -> %d rows", struct_field, structure_value, len(all_rows))
+def fetch_rows_for_structures(struct_field: str, structure_values: List[str], top_per_page: int = PAGE_SIZE) -> List[Tuple]:
+    """
+    Pull rows for a chunk of structures in one query, filtered by the detected structure field.
+    Pages with $top/$skip, following any server-side __next links within each page.
+    Rows come back as tuples in _select_fields order.
+    """
+    fields = _select_fields(struct_field)
+    base_url, params = _structure_query(struct_field, structure_values, top_per_page)
+    all_rows, skip = _load_checkpoint(params)
+
+    while skip is not None:
+        rows, next_link = _stream_rows_and_next(base_url, {**params, "$skip": str(skip)})
+        page = _row_tuples(rows, fields)
+        while next_link:
+            rows, next_link = _stream_rows_and_next(next_link, {})
+            page.extend(_row_tuples(rows, fields))
+        all_rows.extend(page)
+        skip = _save_page(params, page, skip, top_per_page)
+
+    logging.info("  %d x %s (%s..%s) -> %d rows", len(structure_values), struct_field,
+                 structure_values[0], structure_values[-1], len(all_rows))
     return all_rows
 
-def _stringify_unhashables(x: Any) -> Any:
-    if isinstance(x, (dict, list, set)):
-        return str(x)
-    return x
+def fetch_rows_batched(struct_field: str, chunks: List[List[str]], top_per_page: int = PAGE_SIZE) -> List[Tuple]:
+    """
+    Same as fetch_rows_for_structures, but for several chunks at once through $batch.
+    Follow-up requests (__next links and further $skip pages) go together in the next round.
+    """
+    fields = _select_fields(struct_field)
+    all_rows: List[Tuple] = []
+    # (query state, url, params) for every request of the upcoming round
+    pending = []
+    for c in chunks:
+        base_url, params = _structure_query(struct_field, c, top_per_page)
+        rows, skip = _load_checkpoint(params)
+        all_rows.extend(rows)
+        if skip is not None:
+            query = {"url": base_url, "params": params, "skip": skip, "page": []}
+            pending.append((query, base_url, {**params, "$skip": str(skip)}))
+
+    while pending:
+        next_round = []
+        for batch in _chunks(pending, BATCH_QUERIES):
+            results = post_batch([(url, params) for _, url, params in batch])
+            for (query, _, _), data in zip(batch, results):
+                rows, next_link = _extract_results_and_next(data)
+                query["page"].extend(_row_tuples(rows, fields))
+                if next_link:
+                    next_round.append((query, next_link, {}))
+                    continue
+                all_rows.extend(query["page"])
+                query["skip"] = _save_page(query["params"], query["page"], query["skip"], top_per_page)
+                query["page"] = []
+                if query["skip"] is not None:
+                    next_round.append((query, query["url"], {**query["params"], "$skip": str(query["skip"])}))
+        pending = next_round
+
+    logging.info("  %d chunks via $batch -> %d rows", len(chunks), len(all_rows))
+    return all_rows
 
-def run_etl() -> pd.DataFrame:
+def _dedupe_rows(rows: List[Tuple], seen: set) -> List[Tuple]:
+    """
+    Drop rows already seen in this run. Only a 16-byte digest per unique row is kept.
+    """
+    out = []
+    for r in rows:
+        key = hashlib.blake2b(orjson.dumps(r, default=str), digest_size=16).digest()
+        if key not in seen:
+            seen.add(key)
+            out.append(r)
+    return out
+
+def _fetch_rows_or_log(struct_field: str, chunk: List[Any]) -> Optional[List[Tuple]]:
+    # None marks a failed chunk; run_etl keeps going so the other chunks still get checkpointed
+    try:
+        if USE_BATCH:
+            return fetch_rows_batched(struct_field, chunk)
+        return fetch_rows_for_structures(struct_field, chunk)
+    except Exception as e:
+        logging.exception("Failed for %s in %s: %s", struct_field, chunk, e)
+        return None
+
+def run_etl(out_path: str) -> int:
+    """
+    Fetch everything and stream it to out_path chunk by chunk, so at most
+    2 * MAX_WORKERS chunks' rows are in memory at once. Returns the number of rows written.
+    """
     struct_field, structures = fetch_distinct_structures()
-    all_records: List[Dict] = []
-
-    for i, s in enumerate(structures, start=1):
-        logging.info("(%d/%d) Fetching structure: %s", i, len(structures), s)
-        try:
-            all_records.extend(fetch_rows_for_structure(struct_field, s))
-        except Exception as e:
-            logging.exception("Failed for %s=%s: %s", struct_field, s, e)
-        time.sleep(REQUEST_PAUSE)
-
-    if not all_records:
+    fields = _select_fields(struct_field)
+    names = [RENAME_MAP.get(f, f) for f in fields]
+    schema = pa.schema(list(zip(names, _arrow_schema(fields).types)))
+    seen: set = set()
+    written = 0
+    failed: List[Any] = []
+    chunks = list(_chunks(structures, FILTER_CHUNK_SIZE))
+    if USE_BATCH:
+        # each worker unit is one $batch worth of chunk queries
+        chunks = list(_chunks(chunks, BATCH_QUERIES))
+
+    # Write next to the target and swap in at the end, so a crashed run never
+    # leaves a half-written CSV behind
+    tmp_path = f"{out_path}.tmp"
+
+    # HTTP latency dominates, so fan the chunked pulls out over a thread pool
+    # (requests releases the GIL while waiting on the socket).
+    logging.info("Fetching %d structures in %d chunks with %d workers%s",
+                 len(structures), len(chunks), MAX_WORKERS, " via $batch" if USE_BATCH else "")
+    with pacsv.CSVWriter(tmp_path, schema) as writer, ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        # Keep only a bounded window of chunks submitted, topped up as results are
+        # written; otherwise finished chunks pile up behind a slow one
+        pending_chunks = iter(chunks)
+        window = deque((c, ex.submit(_fetch_rows_or_log, struct_field, c))
+                       for c in islice(pending_chunks, 2 * MAX_WORKERS))
+        i = 0
+        while window:
+            chunk, future = window.popleft()
+            rows = future.result()
+            for c in islice(pending_chunks, 1):
+                window.append((c, ex.submit(_fetch_rows_or_log, struct_field, c)))
+            i += 1
+            if rows is None:
+                failed.append(chunk)
+                continue
+            logging.info("(%d/%d) Fetched chunk", i, len(chunks))
+            rows = _dedupe_rows(rows, seen)
+            if rows:
+                writer.write_table(_rows_to_table(rows, fields).rename_columns(names))
+                written += len(rows)
+
+    if failed and CHECKPOINT_DIR:
+        # Don't publish a CSV with holes in it; checkpoints stay so a re-run only redoes the failures
+        os.remove(tmp_path)
+        raise RuntimeError(f"{len(failed)} of {len(chunks)} chunks failed; {out_path} was not updated")
+    if failed:
+        # Without checkpoints a re-run starts over anyway, so publish what we have
+        logging.warning("%d of %d chunks failed and were skipped: %s", len(failed), len(chunks),
+                        "; ".join(",".join(c) for c in failed))
+
+    os.replace(tmp_path, out_path)
+    if not written:
         logging.warning("No records fetched.")
-        return pd.DataFrame()
-
-    df = pd.DataFrame.from_records(all_records).rename(columns=RENAME_MAP)
-
-    # Put expected columns first if present
-    ordered = [RENAME_MAP.get(c, c) for c in (BASE_SELECT_FIELDS + ["COCHAR_STRUCTURE", "C0CHAR_STRUCTURE"])]
-    first = [c for c in ordered if c in df.columns]
-    rest = [c for c in df.columns if c not in first]
-    df = df[first + rest]
-
-    df = df.map(_stringify_unhashables).drop_duplicates()
-    return df
+    return written
 
 def main():
     logging.info("Starting SAP OData ETL...")
@@ -215,12 +669,15 @@ def main():
     logging.info("Entity: %s", SAP_MAIN_QUERY)
     logging.info("Output CSV: %s", OUTPUT_CSV)
 
-    df = run_etl()
-
     out_path = OUTPUT_CSV
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    df.to_csv(out_path, index=False, encoding="utf-8")
-    logging.info("Wrote %d rows to %s", len(df), out_path)
+    _discard_stale_checkpoints()
+    written = run_etl(out_path)
+    logging.info("Wrote %d rows to %s", written, out_path)
+
+    # The CSV is complete, so the next run should start from scratch
+    if CHECKPOINT_DIR:
+        shutil.rmtree(CHECKPOINT_DIR, ignore_errors=True)
 
 if __name__ == "__main__":
     main()